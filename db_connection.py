@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright: Wilde Consulting
+
+VERSION INFO::
+  License: Apache 2.0
+    $Repo: git_kw_substitution
+  $Author: Anders Wiklund
+    $Date: 2024-03-28 16:40:42
+     $Rev: 1
+"""
+
+# Third party modules
+import pymysql as db
+from pymysql.constants import CLIENT
+
+# local modules
+from secrets_manager import get_dsn
+
+
+# ---------------------------------------------------------
+#
+def get_conn() -> db.connections.Connection:
+    """ Return a new MySQL connection based on the B{mysql_dsn} secrets file.
+
+    Multiple statements are allowed in one query to reduce the number of
+    network round-trips.
+
+    Each hook process only needs one connection, so there's no point in
+    pooling them.
+
+    @return: MySQL connection.
+    """
+    return db.connect(client_flag=CLIENT.MULTI_STATEMENTS, **get_dsn())
@@ -16,12 +16,10 @@ from pathlib import Path
 from contextlib import closing
 
 # Third party modules
-import ujson as json
-import pymysql as db
+import orjson
 
 # local modules
-from secrets_manager import get_secrets_file_content
-from git_utilities import get_git_root_path, get_git_commit_hash
+from git_utilities import get_git_root_path_and_commit_hash
 
 
 # ---------------------------------------------------------
@@ -47,34 +45,36 @@ def update_repository_tables(data: dict):
     @param data: GIT commit data.
     """
 
-    config = get_secrets_file_content('mysql_dsn')
-    dsn: dict = dict([tuple(x.split('=')) for x in config.split(',')])
+    # The DB driver is imported on demand, so commits without
+    # a pre-commit repo file don't pay for its import time.
+    from db_connection import get_conn
 
-    if 'port' in dsn:
-        dsn['port'] = int(dsn['port'])
-
-    with closing(db.connect(**dsn)) as hdl:
+    with closing(get_conn()) as hdl:
         cur = hdl.cursor()
-        cur.execute("UPDATE git.repositories SET hash='{hash}' "
-                    "WHERE name='{name}' AND branch='{branch}'".format(**data))
-        cur.execute("INSERT IGNORE INTO git.repository_history "
+
+        # Both statements are sent in one network round-trip.
+        cur.execute("UPDATE git.repositories SET hash=%(hash)s "
+                    "WHERE name=%(name)s AND branch=%(branch)s; "
+                    "INSERT IGNORE INTO git.repository_history "
                     "(name, created, revision, hash, branch) VALUES "
-                    "('{name}','{created}',{rev},'{hash}','{branch}')".format(**data))
+                    "(%(name)s, %(created)s, %(rev)s, %(hash)s, %(branch)s)", data)
+
+        # Consume the result of the second statement.
+        while cur.nextset():
+            pass
 
 
 # ---------------------------------------------------------
 #
-def compile_commit_data(repo_file: Path) -> dict:
+def compile_commit_data(repo_file: Path, commit_hash: str) -> dict:
     """ Return compiled pre-commit data from GIT and repo file.
 
     @param repo_file: Name of the .pre-commit-repo.json file.
+    @param commit_hash: Latest GIT commit hash.
     @return: Compiled commit data.
     """
 
-    commit_hash = get_git_commit_hash()
-
-    with open(repo_file, 'r', encoding='latin1') as hdl:
-        commit_data = json.load(hdl)
+    commit_data = orjson.loads(repo_file.read_bytes())
 
     return {'rev': commit_data['rev'],
             'hash': commit_hash, 'branch': commit_data['branch'],
@@ -121,10 +121,11 @@ def run():
                 stages: [post-commit, post-merge]
     """
 
-    repo_file = get_git_root_path() / '.pre-commit-repo.json'
+    root_path, commit_hash = get_git_root_path_and_commit_hash()
+    repo_file = root_path / '.pre-commit-repo.json'
 
     if repo_file.exists():
-        commit_data = compile_commit_data(repo_file)
+        commit_data = compile_commit_data(repo_file, commit_hash)
         update_repository_tables(commit_data)
         repo_file.unlink()
 
@@ -15,27 +15,37 @@ VERSION INFO::
 import os
 import re
 import sys
+import shutil
 import hashlib
 from pathlib import Path
-from typing import Optional
 from datetime import datetime
 from contextlib import closing
+from tempfile import NamedTemporaryFile
 
 # Third party modules
-import ujson as json
-import pymysql as db
-from filelock import FileLock
+import orjson
 
 # local modules
-from secrets_manager import get_secrets_file_content
-from git_utilities import get_git_root_path, get_git_username, get_git_branch
+from native_lock import lock
+from git_utilities import (get_git_root_path, get_git_username,
+                           get_git_branch, get_git_staged_files)
 
 # Constants
-RE_KEYS = [r'\$Repo:', r'\$Author:', r'\$Date:', r'\$Rev:']
-""" Regex header block dynamic keys. """
+HEADER_RE = re.compile(r'( +?\$(Repo|Author|Date|Rev):)([^\r\n]+)')
+""" Regex for the header block dynamic keys. """
 PATCHABLE_EXT_PREFIXES = {'.conf': '#---', '.env': '#---', '.ini': '#---',
                           '.py': '"""\n', '.toml': '#---', '.yaml': '#---'}
 """ Header identification keys based on extension. """
+HEADER_DELIMITERS = {
+    ext: re.compile((rb'^' + re.escape(prefix[:-1].encode('utf8')) + rb'\r?$\n?')
+                    if prefix.endswith('\n') else
+                    (rb'^' + re.escape(prefix.encode('utf8')) + rb'[^\n]*\n?'),
+                    re.MULTILINE)
+    for ext, prefix in PATCHABLE_EXT_PREFIXES.items()}
+""" Header delimiter row regex based on extension. A prefix that includes the
+EOL must match a complete row, otherwise the rest of the row is ignored. """
+HASH_ALGO = 'blake2b-128'
+""" Name of the content digest algorithm stored in the repo file. """
 
 
 # -----------------------------------------------------------------------------
@@ -47,11 +57,13 @@ class GitPreCommitHook:
     a valid file extension.
 
     Since this program changes the header block in the GIT supplied files, the
-    initial commit will always fail.
+    initial commit will fail when a header block is updated. A commit that only
+    touches files without keywords, or with up-to-date keyword values, passes
+    on the first attempt since those files are not rewritten.
 
-    To make the second commit successful, we need to store calculated CRC values
+    To make the second commit successful, we need to store calculated digest values
     for each file in a temporary json repo B{.pre-commit-repo.json} file.
-    When the additional commit is executed, the CRC values will be the same and
+    When the additional commit is executed, the digest values will be the same and
     no file change is needed.
 
     The repositories' table is stored in a MySQL DB that needs to be placed on
@@ -73,7 +85,9 @@ class GitPreCommitHook:
     Note that a Git commit command can call the pre-commit hook several
     times with a subset of the files being committed.
     This is handled
-    by reserving exclusive access for the program to work.
+    by reserving exclusive access for the program to work. It's recommended
+    to set I{pass_filenames: false} for the hook, so it runs only once per
+    commit and picks up the staged files from the GIT index by itself.
 
     Handled file types are::
       - .py
@@ -97,8 +111,10 @@ class GitPreCommitHook:
                 language: system
                 stages: [commit, merge-commit]
                 types: [text]
+                pass_filenames: false
 
-    Git provides all required values in the command line arguments::
+    When pass_filenames is enabled, Git provides all required values in the
+    command line arguments::
       [0..n] => file1..n
 
 
@@ -108,11 +124,14 @@ class GitPreCommitHook:
     @type commit_data: L{dict}
     @ivar commit_data: Holds commit data for the files being committed.
 
-    @type infile: L{Path}
-    @ivar infile: Holds commit data for the files being committed.
-
     @type files_modified: L{bool}
-    @ivar files_modified: Tracking of when keyword substitution has happened.
+    @ivar files_modified: Tracking of when commit data needs to be saved.
+
+    @type staged: L{set}
+    @ivar staged: Files that are staged in the GIT index.
+
+    @type substitutions: L{dict}
+    @ivar substitutions: Header block keyword values for the commit.
     """
 
     # ---------------------------------------------------------
@@ -123,75 +142,101 @@ class GitPreCommitHook:
         Command line arguments are::
           <file1> <file2> <file3>...
 
+        When no arguments are given, the staged files are fetched from the
+        GIT index instead.
+
         @param args: Command line arguments.
         """
 
         # Input parameters.
-        self.files: list = args
+        self.files: list = args or [get_git_root_path() / name
+                                    for name in get_git_staged_files()]
 
         # Unique parameters.
         self.commit_data = {}
+        self.staged = set()
+        self.substitutions = {}
         self.files_modified = False
-        self.infile: Optional[Path] = None
 
     # ---------------------------------------------------------
     #
-    def current_infile_ext(self) -> bool:
+    @staticmethod
+    def current_infile_ext(infile: Path) -> str:
         """ Return the infile file extension.
 
         Make sure you get the extension, even from a '.env' file.
 
+        @param infile: File being processed.
         @return: Current infile file extension.
         """
-        return self.infile.suffix or self.infile.name
+        return infile.suffix or infile.name
 
     # ---------------------------------------------------------
     #
-    def patchable_file(self) -> bool:
+    def patchable_file(self, infile: Path) -> bool:
         """ Return patchable file status based on the file extension.
 
+        @param infile: File being processed.
         @return: Validation result.
         """
-        ext = self.current_infile_ext()
+        ext = self.current_infile_ext(infile)
 
         return ext in PATCHABLE_EXT_PREFIXES
 
     # ---------------------------------------------------------
     #
-    def crc_of(self) -> str:
-        """ Return MD5 checksum for file.
+    @staticmethod
+    def header_block_span(buf: bytes, ext: str) -> tuple:
+        """ Return the byte offsets of the header block content in the buffer.
 
-        The header block is excluded from the MD5 checksum calculation.
+        The header block content starts right after the first row that starts
+        with the extension prefix and ends at the beginning of the next row
+        that starts with the same prefix. The delimiter rows are not part of
+        the header block content.
 
-        @return: File MD5 checksum.
+        Both LF and CRLF EOL endings are handled.
 
-        @raise RuntimeError: When MD5 CRC calculation fails.
+        @param buf: Complete file content.
+        @param ext: File extension.
+        @return: Header block start and end offsets (both are equal to the
+            buffer length when no header block is found).
         """
 
-        idx = 0
-        header_active = None
-        crc_sum = hashlib.md5()
-        ext = self.current_infile_ext()
+        delimiters = HEADER_DELIMITERS[ext]
+        start = delimiters.search(buf)
 
-        try:
-            with open(self.infile, 'r', encoding='utf8') as hdl:
+        if start is None:
+            return len(buf), len(buf)
 
-                for idx, row in enumerate(hdl.readline(), 1):
+        end = delimiters.search(buf, start.end())
 
-                    if not header_active:
-                        crc_sum.update(bytes(row, encoding='utf8'))
-                        header_start = row.startswith(PATCHABLE_EXT_PREFIXES[ext])
+        return start.end(), (end.start() if end else len(buf))
 
-                    if header_active is None and header_start:
-                        header_active = True
+    # ---------------------------------------------------------
+    #
+    @staticmethod
+    def digest_of(buf: bytes, span: tuple) -> str:
+        """ Return content digest for file.
 
-                    elif header_active and header_start:
-                        header_active = False
+        The digest is only used for change detection, so BLAKE2b is used
+        since it's faster than MD5 on 64-bit platforms.
 
-        except BaseException as why:
-            raise RuntimeError(f'ERROR (line {idx} in file {self.infile}): {why}')
+        The header block is excluded from the digest calculation.
 
-        return crc_sum.hexdigest()
+        @param buf: Complete file content.
+        @param span: Header block start and end offsets.
+        @return: File content digest.
+        """
+
+        start, end = span
+        digest = hashlib.blake2b(digest_size=16)
+
+        # Let the hash object consume the data in bulk, without copying.
+        view = memoryview(buf)
+        digest.update(view[:start])
+        digest.update(view[end:])
+
+        return digest.hexdigest()
 
     # ---------------------------------------------------------
     #
@@ -209,34 +254,48 @@ class GitPreCommitHook:
 
         The revision is incremented by 1 for each call to this function.
 
+        The incremented revision is handed back through LAST_INSERT_ID(), so it's
+        read atomically in the same round-trip as the update. A new row has no
+        insert ID (the table has no AUTO_INCREMENT column) and gets the default
+        revision.
+
         @return: Repository revision.
         """
 
         updated = self.commit_data['date']
         branch = self.commit_data['branch']
         repository = self.commit_data['repo']
-        config = get_secrets_file_content('mysql_dsn')
-        dsn: dict = dict([tuple(x.split('=')) for x in config.split(',')])
 
-        if 'port' in dsn:
-            dsn['port'] = int(dsn['port'])
+        # The DB driver is imported on demand, so hook runs where no staged
+        # file digest has changed don't pay for its import time.
+        from db_connection import get_conn
 
-        with closing(db.connect(**dsn)) as hdl:
+        with closing(get_conn()) as hdl:
             cur = hdl.cursor()
 
-            cur.execute(f"INSERT INTO git.repositories (name, updated, branch) "
-                        f"VALUES('{repository}', '{updated}', '{branch}') "
-                        f"ON DUPLICATE KEY UPDATE "
-                        f"updated='{updated}', revision=revision+1")
-            cur.execute(f"SELECT revision FROM git.repositories "
-                        f"WHERE name='{repository}' AND branch='{branch}'")
-            result = cur.fetchone()[0]
+            cur.execute("INSERT INTO git.repositories (name, updated, branch) "
+                        "VALUES(%s, %s, %s) "
+                        "ON DUPLICATE KEY UPDATE "
+                        "updated=%s, revision=LAST_INSERT_ID(revision+1)",
+                        (repository, updated, branch, updated))
+            result = cur.lastrowid or 1
 
         return result
 
     # ---------------------------------------------------------
     #
-    def update_header_block(self, current_crc: str):
+    def substitute_keyword(self, match: re.Match) -> str:
+        """ Return the matched header block keyword with its current value.
+
+        @param match: HEADER_RE match.
+        @return: Keyword with current value.
+        """
+        return f'{match.group(1)} {self.substitutions[match.group(2)]}'
+
+    # ---------------------------------------------------------
+    #
+    def update_header_block(self, infile: Path, current_digest: str,
+                            buf: bytes, span: tuple):
         """ Update keyword values in the file header block.
 
         The following keywords are automatically updated in the header block::
@@ -248,110 +307,138 @@ class GitPreCommitHook:
           Rev and Author are retrieved from git. Date is a current ISO timestamp
           and Rev comes from the database.
 
-        @param current_crc: MD5 checksum for current file.
-        """
+        A changed file always gets a new revision and its digest is saved in
+        the repo file, so the post-commit hook records the commit. Only the
+        file rewrite is skipped when the header block would not change.
 
-        # Only update once regardless of the number of pre-commit hook thread calls.
-        if self.commit_data['rev'] == 0:
-            self.commit_data['rev'] = self.get_new_repository_revision()
+        @param infile: File being processed.
+        @param current_digest: Content digest for current file.
+        @param buf: Complete file content.
+        @param span: Header block start and end offsets.
+        """
 
-        # Create a backup of the original file in case something fails.
-        orig_file = self.infile.with_suffix('.bak')
-        self.infile.rename(orig_file)
+        start, end = span
+        key = str(infile)
 
-        header_active = None
-        key = str(self.infile)
         self.files_modified = True
-        ext = self.current_infile_ext()
-        user = self.commit_data['user']
-        revision = self.commit_data['rev']
-        timestamp = self.commit_data['date']
-        repository = self.commit_data['repo']
-        self.commit_data['files'][key] = current_crc
-        print(f'Updating header block in file {self.infile}')
+        self.commit_data['files'][key] = current_digest
 
-        # To keep the original file EOL endings, we need to write the rows in binary format
-        # since PYTHON will automatically convert them to CRLF endings on the win32 platform.
-        with (open(orig_file, 'r', encoding='utf8') as in_hdl,
-              open(self.infile, 'wb') as out_hdl):
+        # The keyword values are the same for all files in the commit.
+        if not self.substitutions:
 
-            for row in in_hdl:
+            # Only update once regardless of the number of pre-commit hook calls.
+            if self.commit_data['rev'] == 0:
+                self.commit_data['rev'] = self.get_new_repository_revision()
+
+            self.substitutions = {'Repo': self.commit_data['repo'],
+                                  'Author': self.commit_data['user'],
+                                  'Date': self.commit_data['date'],
+                                  'Rev': str(self.commit_data['rev'])}
+
+        # To keep the original file EOL endings, we need to work with the content
+        # in binary format, and only decode the header block that is changed.
+        original = buf[start:end].decode('utf8')
+        header = HEADER_RE.sub(self.substitute_keyword, original)
+
+        # Leave the file untouched when the keyword values are already up-to-date.
+        if header == original:
+            return
 
-                # Only look for values to change inside the header block.
-                if header_active:
-                    row = re.sub(fr"( +?{RE_KEYS[1]})(.+)", fr"\1 {user}", row)
-                    row = re.sub(fr"( +?{RE_KEYS[3]})(.+)", fr"\1 {revision}", row)
-                    row = re.sub(fr"( +?{RE_KEYS[2]})(.+)", fr"\1 {timestamp}", row)
-                    row = re.sub(fr"( +?{RE_KEYS[0]})(.+)", fr"\1 {repository}", row)
+        print(f'Updating header block in file {infile}')
 
-                if header_active is None and row.startswith(PATCHABLE_EXT_PREFIXES[ext]):
-                    header_active = True
+        # Write to a temporary file next to the original and atomically replace
+        # the original with it, so a failure never leaves a half-written file.
+        hdl = NamedTemporaryFile(dir=infile.parent, prefix=f'{infile.name}.',
+                                 suffix='.tmp', delete=False)
 
-                elif header_active and row.startswith(PATCHABLE_EXT_PREFIXES[ext]):
-                    header_active = False
+        try:
+            with hdl:
+                hdl.write(buf[:start] + header.encode('utf8') + buf[end:])
 
-                out_hdl.write(bytes(row, encoding='utf8'))
+            shutil.copymode(infile, hdl.name)
+            os.replace(hdl.name, infile)
 
-        # Remove the original file backup since no errors occurred.
-        orig_file.unlink()
+        except BaseException:
+            os.unlink(hdl.name)
+            raise
 
     # ---------------------------------------------------------
     #
-    def process_file(self):
-        """ Update key values in the file header block when MD5 checksum is different.
+    def process_file(self, infile: Path):
+        """ Update key values in the file header block when content digest is different.
+
+        The header block is excluded from the digest calculation. The file is
+        only read once, the content is shared by the digest calculation and
+        the header block update.
 
-        The header block is excluded from the MD5 checksum calculation.
+        @param infile: File being processed.
+
+        @raise RuntimeError: When reading the file fails.
         """
 
+        try:
+            buf = infile.read_bytes()
+
+        except BaseException as why:
+            raise RuntimeError(f'ERROR (file {infile}): {why}')
+
         # Ignore empty files (like __init__.py).
-        if os.path.getsize(self.infile) == 0:
+        if not buf:
             return
 
-        key = str(self.infile)
-        current_crc = self.crc_of()
-        original_crc = self.commit_data['files'].get(key)
+        key = str(infile)
+        span = self.header_block_span(buf, self.current_infile_ext(infile))
+        current_digest = self.digest_of(buf, span)
+        original_digest = self.commit_data['files'].get(key)
 
-        if current_crc != original_crc:
-            self.update_header_block(current_crc)
+        if current_digest != original_digest:
+            self.update_header_block(infile, current_digest, buf, span)
 
     # ---------------------------------------------------------
     #
     def run(self):
         """
         Process received files and change header block keywords
-        if MD5 checksum differs.
+        if content digest differs.
         """
 
         root_path = get_git_root_path()
         repo_file = root_path / '.pre-commit-repo.json'
         repo_lock_file = repo_file.with_suffix('.lock')
+        self.staged = {root_path / name for name in get_git_staged_files()}
 
-        with FileLock(repo_lock_file, timeout=1):
+        with lock(repo_lock_file):
             try:
                 # This is the first time the GIT commit command is executed.
                 if not repo_file.exists():
                     local_now = datetime.now().isoformat(' ', timespec='seconds')
                     self.commit_data = {'user': get_git_username(), 'files': {},
                                         'repo': root_path.name.lower(), 'rev': 0,
-                                        'branch': get_git_branch(), 'date': local_now}
+                                        'branch': get_git_branch(), 'date': local_now,
+                                        'hash_algo': HASH_ALGO}
 
                 # File exists when the GIT commit command is
                 # executed for the second (or n-th) time.
                 else:
 
-                    with open(repo_file, 'r', encoding='latin1') as hdl:
-                        self.commit_data = json.load(hdl)
+                    self.commit_data = orjson.loads(repo_file.read_bytes())
+
+                    # Stored digests are useless when calculated in another way.
+                    if self.commit_data.get('hash_algo') != HASH_ALGO:
+                        self.commit_data['hash_algo'] = HASH_ALGO
+                        self.commit_data['files'] = {}
 
-                for item in self.files:
-                    self.infile = Path(item).absolute()
+                # Ignore files that are not part of the commit before touching them.
+                infiles = [infile for infile in (root_path / item for item in self.files)
+                           if infile in self.staged and self.patchable_file(infile)]
 
-                    if self.patchable_file():
-                        self.process_file()
+                for infile in infiles:
+                    self.process_file(infile)
 
-                # No point in creating a file if keyword substitution is not performed.
+                # No point in creating a file if no changed files are committed.
                 if self.files_modified:
-                    with open(repo_file, 'w', encoding='latin1') as hdl:
-                        json.dump(self.commit_data, hdl, ensure_ascii=False, indent=2)
+                    repo_file.write_bytes(orjson.dumps(self.commit_data,
+                                                       option=orjson.OPT_INDENT_2))
 
             except BaseException as why:
                 print(f'ERROR: {why}')
@@ -12,11 +12,13 @@ VERSION INFO::
 
 # BUILTIN modules
 from pathlib import Path
+from functools import lru_cache
 from subprocess import check_output
 
 
 # ---------------------------------------------------------
 #
+@lru_cache(maxsize=1)
 def get_git_username() -> str:
     """ Return configured GIT repository username.
 
@@ -29,6 +31,7 @@ def get_git_username() -> str:
 
 # ---------------------------------------------------------
 #
+@lru_cache(maxsize=1)
 def get_git_branch() -> str:
     """ Return current GIT branch.
 
@@ -41,6 +44,7 @@ def get_git_branch() -> str:
 
 # ---------------------------------------------------------
 #
+@lru_cache(maxsize=1)
 def get_git_root_path() -> Path:
     """ Return current GIT repository root path.
 
@@ -55,11 +59,30 @@ def get_git_root_path() -> Path:
 
 # ---------------------------------------------------------
 #
-def get_git_commit_hash() -> str:
-    """ Return Latest GIT commit hash.
+@lru_cache(maxsize=1)
+def get_git_root_path_and_commit_hash() -> tuple:
+    """ Return current GIT repository root path and latest GIT commit hash.
 
-    @return: Latest GIT commit hash.
+    Both values are retrieved by one git command, which saves a process
+    launch. Only use it when HEAD exists, i.e. not before the first commit.
+
+    @return: Current GIT repository root path and latest GIT commit hash.
     """
-    raw = check_output(['git', 'rev-parse', '--verify', 'HEAD'])
+    raw = check_output(['git', 'rev-parse', '--show-toplevel', '--verify', 'HEAD'])
+    root_path, commit_hash = str(raw, encoding='utf8').splitlines()
 
-    return str(raw, encoding='utf8').rstrip()
+    return Path(root_path), commit_hash
+
+
+# ---------------------------------------------------------
+#
+@lru_cache(maxsize=1)
+def get_git_staged_files() -> list:
+    """ Return added, copied, modified and renamed files in the GIT index.
+
+    @return: Staged files (relative to the GIT repository root path).
+    """
+    raw = check_output(['git', 'diff', '--cached', '--name-only',
+                        '--diff-filter=ACMR', '-z'])
+
+    return [Path(name) for name in str(raw, encoding='utf8').split('\0') if name]
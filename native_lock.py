@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright: Wilde Consulting
+
+VERSION INFO::
+  License: Apache 2.0
+    $Repo: git_kw_substitution
+  $Author: Anders Wiklund
+    $Date: 2024-03-28 16:40:42
+     $Rev: 1
+"""
+
+# BUILTIN modules
+import os
+import sys
+from pathlib import Path
+from contextlib import contextmanager
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+
+# ---------------------------------------------------------
+#
+@contextmanager
+def lock(path: Path):
+    """ Hold an exclusive OS advisory lock on the specified file.
+
+    On POSIX the calling process sleeps in the kernel until the lock is
+    available, there is no polling involved. On win32 msvcrt retries once
+    a second and gives up after 10 attempts. The file is created when
+    it's missing.
+
+    @param path: Name of the lock file.
+
+    @raise OSError: When the lock is not acquired within 10 seconds (win32).
+    """
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    try:
+        if sys.platform == 'win32':
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+        try:
+            yield
+
+        finally:
+            if sys.platform == 'win32':
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    finally:
+        os.close(fd)
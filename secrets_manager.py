@@ -13,6 +13,13 @@ VERSION INFO::
 # BUILTIN modules
 import site
 from pathlib import Path
+from types import MappingProxyType
+
+# Constants
+_CACHE: dict[str, str] = {}
+""" Secrets file content, cached by name. """
+_DSN_CACHE: dict[str, MappingProxyType] = {}
+""" Parsed DB connection parameters, cached by secrets file name. """
 
 
 # ---------------------------------------------------------
@@ -32,6 +39,9 @@ def get_secrets_file_content(name: str) -> str:
         @raise RuntimeError: when secrets file is not found,
     """
 
+    if name in _CACHE:
+        return _CACHE[name]
+
     # Make sure it's working, even when in a frozen environment.
     secrets_file = Path(f'{site.getuserbase()}/secrets/{name}')
 
@@ -41,4 +51,33 @@ def get_secrets_file_content(name: str) -> str:
     with secrets_file.open() as hdl:
         result = hdl.read().rstrip()
 
+    _CACHE[name] = result
+
     return result
+
+
+# ---------------------------------------------------------
+#
+def get_dsn(name: str = 'mysql_dsn') -> MappingProxyType:
+    """ Return DB connection parameters from the specified secrets file.
+
+        The secrets file content is expected to look like this::
+
+            user=*****,password=*****,host=*****,port=3306,autocommit=true
+
+        The file is only read and parsed on the first call, the result is
+        returned as a read-only mapping since it's shared between callers.
+
+        @param name: Name of secrets file (no path).
+        @return: DB connection parameters (port is converted to int).
+
+        @raise RuntimeError: when secrets file is not found,
+    """
+
+    if name not in _DSN_CACHE:
+        config = get_secrets_file_content(name)
+        result = {key: (int(value) if key == 'port' else value)
+                  for key, value in (item.split('=', 1) for item in config.split(','))}
+        _DSN_CACHE[name] = MappingProxyType(result)
+
+    return _DSN_CACHE[name]